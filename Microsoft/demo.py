@@ -14,7 +14,7 @@ import os
 from rich.console import Console
 from rich.panel import Panel
 from rich.table import Table
-from rich.progress import Progress, SpinnerColumn, TextColumn
+from rich.progress import Progress, SpinnerColumn, TextColumn, BarColumn
 import logging
 
 # Import the query processor components
@@ -137,18 +137,21 @@ def run_benchmark_demo(config_path=None, iterations=10):
         total_time = 0
         model_counts = {}
         
-        for i, query in enumerate(queries):
-            if i >= iterations:
-                break
-                
-            with Progress(
-                SpinnerColumn(),
-                TextColumn(f"[cyan]Processing query {i+1}/{min(iterations, len(queries))}...[/cyan]"),
-                transient=True
-            ) as progress:
-                progress.add_task("processing", total=None)
-                result = processor.process_query(query)
+        # Score the whole tier in one anomaly-detection batch; model calls run concurrently
+        with Progress(
+            SpinnerColumn(),
+            TextColumn("[cyan]Processing queries...[/cyan]"),
+            BarColumn(),
+            TextColumn("{task.completed}/{task.total}"),
+            transient=True
+        ) as progress:
+            task = progress.add_task("processing", total=min(iterations, len(queries)))
+            results = processor.process_queries(
+                queries[:iterations],
+                progress_callback=lambda result: progress.advance(task)
+            )
             
+        for query, result in zip(queries, results):
             total_time += result['processing_time']
             
             # Count model selections
@@ -10,27 +10,32 @@ import os
 with open("README.md", "r", encoding="utf-8") as fh:
     long_description = fh.read()
 
-# Read the requirements from requirements.txt
-with open("requirements.txt", "r", encoding="utf-8") as fh:
-    requirements = [line.strip() for line in fh if not line.startswith("#")]
+# Bucket requirements by extra in a single pass over requirements.txt
+EXTRA_PREFIXES = {
+    "azure-": "azure",
+    "msal": "ms365",
+    "requests": "ms365",
+    "fastapi": "production",
+    "uvicorn": "production",
+    "pydantic": "production",
+    "python-dotenv": "production",
+}
 
-# Get core, azure, and ms365 requirements
-core_requirements = [req for req in requirements 
-                    if not req.startswith("azure-") 
-                    and not req.startswith("msal") 
-                    and req != "requests>=2.26.0"
-                    and not req.startswith("fastapi")
-                    and not req.startswith("uvicorn")
-                    and not req.startswith("pydantic")
-                    and not req.startswith("python-dotenv")]
+requirements = {"core": [], "azure": [], "ms365": [], "production": []}
+with open("requirements.txt", "r", encoding="utf-8") as fh:
+    for raw in fh:
+        # Drop comments (full-line and inline) and blank lines
+        line = raw.split("#", 1)[0].strip()
+        if not line:
+            continue
+        bucket = next((extra for prefix, extra in EXTRA_PREFIXES.items()
+                       if line.startswith(prefix)), "core")
+        requirements[bucket].append(line)
 
-azure_requirements = [req for req in requirements if req.startswith("azure-")]
-ms365_requirements = ["msal>=1.16.0", "requests>=2.26.0"]
-prod_requirements = [req for req in requirements 
-                    if req.startswith("fastapi")
-                    or req.startswith("uvicorn")
-                    or req.startswith("pydantic")
-                    or req.startswith("python-dotenv")]
+core_requirements = requirements["core"]
+azure_requirements = requirements["azure"]
+ms365_requirements = requirements["ms365"]
+prod_requirements = requirements["production"]
 
 setup(
     name="microsoft-query-processor",
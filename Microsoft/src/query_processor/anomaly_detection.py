@@ -3,26 +3,50 @@ Anomaly detection module for query processing.
 Uses Isolation Forest to detect anomalous queries.
 """
 
-from pyod.models.iforest import IForest
+from sklearn.ensemble import IsolationForest
 from sklearn.preprocessing import StandardScaler
+from operator import itemgetter
 import numpy as np
 import time
 
+# Basic features always written by FeatureExtractor.transform, in column order
+_BASIC_GET = itemgetter('length', 'word_count', 'avg_word_length', 'special_char_ratio')
+
+def _standardize(vec, mean, scale, out):
+    """Standardize vec into out using precomputed scaler statistics"""
+    # Plain NumPy on purpose: two in-place ufuncs on a 4-wide row cost no more than a numba
+    # dispatch, and jitting would add a compile per array layout (rows, row slices, batch matrices)
+    np.subtract(vec, mean, out=out)
+    np.divide(out, scale, out=out)
+    return out
+
 class MultiModalAnomalyDetector:
     def __init__(self, config=None):
         self.config = config or {}
         self.contamination = self.config.get('contamination', 0.1)
         self.n_estimators = self.config.get('n_estimators', 100)
-        self.detector = IForest(
+        self.detector = IsolationForest(
             contamination=self.contamination, 
-            n_estimators=self.n_estimators
+            n_estimators=self.n_estimators,
+            n_jobs=self.config.get('n_jobs', -1)
         )
         self.fitted = False
         self.scaler = StandardScaler()
-        self.detection_history = []
         
-    def preprocess_features(self, features_list):
-        """Standardize numerical features for better anomaly detection"""
+        # Fixed-size ring buffer of (timestamp, score) detections;
+        # timestamps are time.perf_counter_ns() values stored without float boxing
+        self._hist_cap = self.config.get('history_size', 10_000)
+        self._hist_ts = np.empty(self._hist_cap, dtype=np.int64)
+        self._hist_score = np.empty(self._hist_cap, dtype=np.float32)
+        self._hist_idx = 0
+        
+        # Scaler statistics and scoring buffer, set up at fit time
+        self._mean = None
+        self._scale = None
+        self._scratch = None
+        
+    def _assemble_matrix(self, features_list):
+        """Stack feature dicts/arrays into a raw (unscaled) feature matrix"""
         if not features_list:
             return np.array([])
             
@@ -31,17 +55,11 @@ class MultiModalAnomalyDetector:
         for features in features_list:
             if isinstance(features, dict):
                 # If features is a dictionary, convert to array
-                numerical_features.append([
-                    features.get('length', 0),
-                    features.get('word_count', 0),
-                    features.get('avg_word_length', 0),
-                    features.get('special_char_ratio', 0)
-                ])
+                numerical_features.append(_BASIC_GET(features))
             elif isinstance(features, (list, np.ndarray)):
                 numerical_features.append(features)
                 
-        # Standardize features
-        return self.scaler.fit_transform(np.array(numerical_features))
+        return np.array(numerical_features)
         
     def fit(self, features_list):
         """Train the anomaly detector on historical queries"""
@@ -50,13 +68,34 @@ class MultiModalAnomalyDetector:
             self.fitted = False
             return self
             
-        preprocessed_features = self.preprocess_features(features_list)
-        if len(preprocessed_features) > 0:
-            self.detector.fit(preprocessed_features)
+        matrix = self._assemble_matrix(features_list)
+        if len(matrix) > 0:
+            # Scaler statistics come from training data only; scoring reuses them
+            self.scaler.fit(matrix)
+            self.detector.fit(self.scaler.transform(matrix).astype(np.float32))
+            self._mean = self.scaler.mean_.astype(np.float32)
+            self._scale = self.scaler.scale_.astype(np.float32)
+            self._scratch = np.empty(self._mean.shape[0], dtype=np.float32)
             self.fitted = True
             
         return self
         
+    def _outlier_scores(self, matrix):
+        """Outlier scores for a float32 matrix; higher means more anomalous"""
+        # Negated to keep the PyOD IForest sign convention used by the model router
+        return -self.detector.decision_function(matrix)
+        
+    def _fill_row(self, features, out):
+        """Write a feature dict into out, truncated to the fitted feature count"""
+        out[:4] = _BASIC_GET(features)
+        out[4:] = 0
+        # Scatter the non-zero TF-IDF entries if available
+        tfidf = features.get('tfidf_sparse')
+        if tfidf is not None and out.shape[0] > 4:
+            in_range = tfidf.indices < out.shape[0] - 4
+            out[4 + tfidf.indices[in_range]] = tfidf.data[in_range]
+        return out
+        
     def score_anomaly(self, features):
         """Score a query for anomalousness"""
         if not self.fitted:
@@ -65,29 +104,99 @@ class MultiModalAnomalyDetector:
             
         # Handle both dictionary and array features
         if isinstance(features, dict):
-            numerical_features = [
-                features.get('length', 0),
-                features.get('word_count', 0),
-                features.get('avg_word_length', 0),
-                features.get('special_char_ratio', 0)
-            ]
-            # Add TF-IDF features if available
-            if 'tfidf' in features and isinstance(features['tfidf'], np.ndarray):
-                numerical_features.extend(features['tfidf'])
+            # Write straight into the scoring buffer
+            scratch = self._fill_row(features, self._scratch)
+            preprocessed = _standardize(scratch, self._mean, self._scale, scratch).reshape(1, -1)
         else:
-            numerical_features = features
-            
-        # Preprocess single example
-        preprocessed = self.scaler.transform([numerical_features])[0].reshape(1, -1)
+            # Copy into the scoring buffer, truncating or zero-padding to the fitted width
+            scratch = self._scratch
+            n = min(len(features), scratch.shape[0])
+            scratch[:n] = features[:n]
+            scratch[n:] = 0
+            preprocessed = _standardize(scratch, self._mean, self._scale, scratch).reshape(1, -1)
         
         # Score and record the detection
-        score = self.detector.decision_function(preprocessed)[0]
+        score = self._outlier_scores(preprocessed)[0]
+        self._record_detection(score)
+        
+        return score
+        
+    def score_vector(self, vec):
+        """
+        Score a raw numerical feature vector without copying it.
+        
+        The leading fitted-width slice of vec is standardized in place, so the
+        caller's buffer is overwritten.
+        
+        Args:
+            vec: float32 feature vector at least as wide as the fitted features
+            
+        Returns:
+            Anomaly score
+        """
+        if not self.fitted:
+            return 0.0
+            
+        row = vec[:self._mean.shape[0]]
+        score = self._outlier_scores(_standardize(row, self._mean, self._scale, row).reshape(1, -1))[0]
+        self._record_detection(score)
+        
+        return score
+        
+    def _record_detection(self, score):
+        """Record a detection for analysis"""
+        i = self._hist_idx % self._hist_cap
+        self._hist_ts[i] = time.perf_counter_ns()
+        self._hist_score[i] = score
+        self._hist_idx += 1
         
-        # Record detection for analysis
-        self.detection_history.append({
-            'timestamp': time.time(),
-            'features': numerical_features,
-            'score': score
-        })
+    def score_anomaly_batch(self, features_list):
+        """
+        Score several queries with a single detector call.
         
-        return score 
\ No newline at end of file
+        Args:
+            features_list: List of feature dicts/arrays, or a 2-D feature matrix
+            
+        Returns:
+            Array of anomaly scores, one per query
+        """
+        if not self.fitted or len(features_list) == 0:
+            return np.zeros(len(features_list))
+            
+        matrix = np.empty((len(features_list), self._mean.shape[0]), dtype=np.float32)
+        for row, features in zip(matrix, features_list):
+            if isinstance(features, dict):
+                self._fill_row(features, row)
+            else:
+                # Truncate or zero-pad to the fitted width, as score_anomaly does
+                n = min(len(features), row.shape[0])
+                row[:n] = features[:n]
+                row[n:] = 0
+                
+        # One standardize + one decision_function for the whole batch
+        scores = self._outlier_scores(_standardize(matrix, self._mean, self._scale, matrix))
+        
+        # Record detections for analysis (only the most recent _hist_cap are kept)
+        n = min(len(scores), self._hist_cap)
+        slots = (self._hist_idx + len(scores) - n + np.arange(n)) % self._hist_cap
+        self._hist_ts[slots] = time.perf_counter_ns()
+        self._hist_score[slots] = scores[-n:]
+        self._hist_idx += len(scores)
+        
+        return scores
+        
+    def get_history(self, n=None):
+        """
+        Return recent detections, oldest first.
+        
+        Args:
+            n: Number of most recent detections to return (default: all retained)
+            
+        Returns:
+            Tuple of (perf_counter_ns timestamps, scores) arrays
+        """
+        count = min(self._hist_idx, self._hist_cap)
+        if n is not None:
+            count = min(count, n)
+        slots = (self._hist_idx - count + np.arange(count)) % self._hist_cap
+        return self._hist_ts[slots], self._hist_score[slots]
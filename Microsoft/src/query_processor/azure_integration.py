@@ -3,10 +3,9 @@ Azure integration module for query processing system.
 Provides integration with Azure services for storage, anomaly detection, and monitoring.
 """
 
+import io
 import os
 import pickle
-import json
-import time
 from datetime import datetime
 import logging
 
@@ -15,6 +14,7 @@ try:
     from azure.storage.blob import BlobServiceClient
     from azure.ai.anomalydetector import AnomalyDetectorClient
     from azure.core.credentials import AzureKeyCredential
+    from azure.core.exceptions import ResourceExistsError
     from azure.monitor.ingestion import LogsIngestionClient
     from azure.monitor.ingestion import LogsIngestionClientAuthenticationPolicy
     from azure.identity import DefaultAzureCredential
@@ -42,7 +42,37 @@ class AzureStorageManager:
             
         self.blob_service_client = BlobServiceClient.from_connection_string(self.connection_string)
         
-    def save_model(self, model, container_name, blob_name):
+        # Container clients reuse the service client's HTTP pipeline
+        self._containers = {}
+        self._created_containers = set()
+        
+    def _container(self, container_name, create=False):
+        """
+        Get a cached container client, optionally making sure the container exists.
+        
+        Args:
+            container_name: Azure Storage container name
+            create: Create the container if needed (checked once per container)
+            
+        Returns:
+            ContainerClient for the container
+        """
+        container_client = self._containers.get(container_name)
+        if container_client is None:
+            container_client = self.blob_service_client.get_container_client(container_name)
+            self._containers[container_name] = container_client
+            
+        if create and container_name not in self._created_containers:
+            # One round-trip instead of exists() + create_container()
+            try:
+                container_client.create_container()
+            except ResourceExistsError:
+                pass
+            self._created_containers.add(container_name)
+            
+        return container_client
+        
+    def save_model(self, model, container_name, blob_name, max_concurrency=8):
         """
         Save a model to Azure Blob Storage.
         
@@ -50,22 +80,27 @@ class AzureStorageManager:
             model: The model object to save
             container_name: Azure Storage container name
             blob_name: Name for the blob 
+            max_concurrency: Number of parallel block uploads
             
         Returns:
             URL of the saved model blob
         """
-        container_client = self.blob_service_client.get_container_client(container_name)
-        
         # Create container if it doesn't exist
-        if not container_client.exists():
-            container_client.create_container()
+        container_client = self._container(container_name, create=True)
             
-        # Serialize the model
-        model_blob = pickle.dumps(model)
+        # Serialize the model straight into an in-memory stream
+        model_stream = io.BytesIO()
+        pickle.dump(model, model_stream, protocol=pickle.HIGHEST_PROTOCOL)
+        model_stream.seek(0)
         
-        # Upload to blob storage
+        # Upload to blob storage as parallel blocks
         blob_client = container_client.get_blob_client(blob_name)
-        blob_client.upload_blob(model_blob, overwrite=True)
+        blob_client.upload_blob(
+            model_stream,
+            overwrite=True,
+            length=model_stream.getbuffer().nbytes,
+            max_concurrency=max_concurrency
+        )
         
         return f"https://{self.blob_service_client.account_name}.blob.core.windows.net/{container_name}/{blob_name}"
         
@@ -80,7 +115,7 @@ class AzureStorageManager:
         Returns:
             The loaded model object
         """
-        container_client = self.blob_service_client.get_container_client(container_name)
+        container_client = self._container(container_name)
         blob_client = container_client.get_blob_client(blob_name)
         
         try:
@@ -102,7 +137,7 @@ class AzureStorageManager:
         Returns:
             List of model blob names
         """
-        container_client = self.blob_service_client.get_container_client(container_name)
+        container_client = self._container(container_name)
         
         try:
             blobs = container_client.list_blobs(name_starts_with=prefix)
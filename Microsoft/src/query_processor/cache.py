@@ -4,9 +4,11 @@ Implements efficient caching of query responses.
 """
 
 import hashlib
-import json
 import os
-from datetime import datetime, timedelta
+import sqlite3
+import threading
+import time
+import orjson
 
 class QueryCache:
     def __init__(self, cache_dir='./cache', ttl_hours=24):
@@ -14,60 +16,76 @@ class QueryCache:
         Initialize the query cache.
         
         Args:
-            cache_dir: Directory to store cache files
+            cache_dir: Directory to store the cache database
             ttl_hours: Time-to-live for cache entries in hours
         """
         self.cache_dir = cache_dir
-        self.ttl = timedelta(hours=ttl_hours)
+        self.ttl_seconds = ttl_hours * 3600
         os.makedirs(cache_dir, exist_ok=True)
+        
+        # Single key-value store instead of one JSON file per entry
+        # Shared across worker threads; access is serialized by self.lock
+        self.db = sqlite3.connect(os.path.join(cache_dir, 'query_cache.db'), check_same_thread=False)
+        self.lock = threading.Lock()
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.execute('PRAGMA synchronous=NORMAL')
+        self.db.execute('CREATE TABLE IF NOT EXISTS cache (key BLOB PRIMARY KEY, value BLOB NOT NULL)')
+        self.db.commit()
+        
         self.cache_stats = {
             'hits': 0,
             'misses': 0,
             'stored': 0
         }
         
-    def _get_cache_key(self, query, model_name):
+    @staticmethod
+    def query_digest(query):
+        """Hash a query once so get and set can share the digest"""
+        return hashlib.blake2b(query.encode(), digest_size=16).digest()
+        
+    def _get_cache_key(self, query, model_name, query_digest=None):
         """Generate a unique cache key for a query+model combination"""
-        hash_input = f"{query}:{model_name}"
-        return hashlib.md5(hash_input.encode()).hexdigest()
+        # Fixed-width digest prefix, so the model name suffix cannot collide across queries
+        if query_digest is None:
+            query_digest = self.query_digest(query)
+        return query_digest + model_name.encode()
         
-    def get(self, query, model_name):
+    def get(self, query, model_name, query_digest=None):
         """
         Retrieve cached response if available and not expired.
         
         Args:
             query: The query string
             model_name: Name of the model used
+            query_digest: Precomputed query_digest(query) (optional)
             
         Returns:
             Cached response or None if not found/expired
         """
-        cache_key = self._get_cache_key(query, model_name)
-        cache_file = os.path.join(self.cache_dir, f"{cache_key}.json")
+        cache_key = self._get_cache_key(query, model_name, query_digest)
         
-        if not os.path.exists(cache_file):
-            self.cache_stats['misses'] += 1
-            return None
-            
         try:
-            with open(cache_file, 'r') as f:
-                cache_data = json.load(f)
-                
-            # Check if cache is expired
-            cached_time = datetime.fromisoformat(cache_data['timestamp'])
-            if datetime.now() - cached_time > self.ttl:
-                self.cache_stats['misses'] += 1
-                return None
-                
-            self.cache_stats['hits'] += 1
-            return cache_data['response']
+            with self.lock:
+                row = self.db.execute('SELECT value FROM cache WHERE key = ?', (cache_key,)).fetchone()
+                if row is None:
+                    self.cache_stats['misses'] += 1
+                    return None
+                    
+            _, _, response, expires_at = orjson.loads(row[0])
+            
+            # Check if cache is expired; counters are shared with worker threads
+            hit = expires_at >= time.time()
+            with self.lock:
+                self.cache_stats['hits' if hit else 'misses'] += 1
+            return response if hit else None
             
         except Exception as e:
             print(f"Cache retrieval error: {e}")
-            self.cache_stats['misses'] += 1
+            with self.lock:
+                self.cache_stats['misses'] += 1
             return None
             
-    def set(self, query, model_name, response):
+    def set(self, query, model_name, response, query_digest=None):
         """
         Store response in cache.
         
@@ -75,29 +93,29 @@ class QueryCache:
             query: The query string
             model_name: Name of the model used
             response: The response to cache
+            query_digest: Precomputed query_digest(query) (optional)
             
         Returns:
             Boolean indicating success
         """
-        cache_key = self._get_cache_key(query, model_name)
-        cache_file = os.path.join(self.cache_dir, f"{cache_key}.json")
-        
-        cache_data = {
-            'query': query,
-            'model': model_name,
-            'response': response,
-            'timestamp': datetime.now().isoformat()
-        }
+        cache_key = self._get_cache_key(query, model_name, query_digest)
         
         try:
-            with open(cache_file, 'w') as f:
-                json.dump(cache_data, f)
-            self.cache_stats['stored'] += 1
+            expires_at = int(time.time()) + self.ttl_seconds
+            cache_data = orjson.dumps((query, model_name, response, expires_at))
+            with self.lock, self.db:
+                self.db.execute('INSERT OR REPLACE INTO cache (key, value) VALUES (?, ?)',
+                                (cache_key, cache_data))
+                self.cache_stats['stored'] += 1
             return True
         except Exception as e:
             print(f"Cache storage error: {e}")
             return False
             
+    def close(self):
+        """Close the cache database"""
+        self.db.close()
+        
     def get_stats(self):
         """Return cache performance statistics"""
         total_requests = self.cache_stats['hits'] + self.cache_stats['misses']
@@ -109,4 +127,4 @@ class QueryCache:
             'stored': self.cache_stats['stored'],
             'hit_rate': hit_rate,
             'total_requests': total_requests
-        } 
\ No newline at end of file
+        }
\ No newline at end of file
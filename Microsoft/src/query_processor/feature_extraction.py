@@ -4,55 +4,149 @@ Extracts semantic and statistical features from queries.
 """
 
 from sklearn.feature_extraction.text import TfidfVectorizer
+from operator import itemgetter
+import functools
 import numpy as np
 
+# Byte lookup tables matching str.isalnum / str.isspace on ASCII input
+_ALNUM_LUT = np.zeros(256, dtype=bool)
+_SPACE_LUT = np.zeros(256, dtype=bool)
+for _i in range(128):
+    _ALNUM_LUT[_i] = chr(_i).isalnum()
+    _SPACE_LUT[_i] = chr(_i).isspace()
+del _i
+
+# Basic features always written by transform, in column order
+_BASIC_GET = itemgetter('length', 'word_count', 'avg_word_length', 'special_char_ratio')
+
+# str.translate table that strips ASCII alphanumerics in C
+_ALNUM_DELETE = dict.fromkeys(i for i in range(128) if chr(i).isalnum())
+
 class FeatureExtractor:
-    def __init__(self, config=None):
+    def __init__(self, config=None, vectorizer=None):
+        """
+        Initialize the feature extractor.
+        
+        Args:
+            config: Feature extraction configuration (optional)
+            vectorizer: Pre-fitted TfidfVectorizer to use (optional)
+        """
         self.config = config or {}
         self.max_features = self.config.get('max_features', 50)
         self.stop_words = self.config.get('stop_words', 'english')
-        self.vectorizer = TfidfVectorizer(
+        self.min_fit_samples = self.config.get('min_fit_samples', 20)
+        self.vectorizer = vectorizer or TfidfVectorizer(
             max_features=self.max_features,
-            stop_words=self.stop_words
+            stop_words=self.stop_words,
+            dtype=np.float32
         )
-        self._fitted = False
+        self._fitted = vectorizer is not None
+        
+        # Queries seen before the vectorizer is fitted
+        self._warmup_queries = []
+        
+        # Repeated queries skip the TF-IDF transform entirely
+        self._tfidf_cached = functools.lru_cache(
+            maxsize=self.config.get('tfidf_cache_size', 4096)
+        )(self._tfidf_raw)
         
     def fit(self, queries):
         """Fit vectorizer on a corpus of queries"""
         self.vectorizer.fit(queries)
+        self._tfidf_cached.cache_clear()
+        self._warmup_queries = []
         self._fitted = True
         return self
         
+    def _tfidf_raw(self, query):
+        """Compute the sparse (1 x vocabulary) TF-IDF row for a query"""
+        tfidf = self.vectorizer.transform([query])
+        # Cached rows are shared between callers
+        tfidf.data.flags.writeable = False
+        return tfidf
+        
+    def _basic_features(self, query):
+        """Return (length, word_count, avg_word_length, special_char_ratio) for a query"""
+        if query.isascii():
+            # Single vectorized pass over the raw bytes
+            b = np.frombuffer(query.encode('ascii'), dtype=np.uint8)
+            length = b.size
+            non_space = ~_SPACE_LUT[b]
+            # A word starts at every non-space byte that follows a space (or the start)
+            word_count = int(non_space[0]) + int(np.count_nonzero(non_space[1:] & ~non_space[:-1])) if length else 0
+            return (
+                length,
+                word_count,
+                int(np.count_nonzero(non_space)) / max(1, word_count),
+                (length - int(np.count_nonzero(_ALNUM_LUT[b]))) / max(1, length)
+            )
+            
+        words = query.split()
+        # Only characters left after stripping ASCII alphanumerics need a per-char check
+        remaining = query.translate(_ALNUM_DELETE)
+        return (
+            len(query),
+            len(words),
+            sum(len(word) for word in words) / max(1, len(words)),
+            sum(not c.isalnum() for c in remaining) / max(1, len(query))
+        )
+        
     def transform(self, query):
         """Extract features from a single query"""
         features = {}
         
         # Basic features
-        features['length'] = len(query)
-        features['word_count'] = len(query.split())
-        features['avg_word_length'] = sum(len(word) for word in query.split()) / max(1, features['word_count'])
-        features['special_char_ratio'] = sum(not c.isalnum() for c in query) / max(1, len(query))
-        
-        # Semantic features - fit on first transform if not already fitted
-        if not self._fitted and hasattr(self, 'vectorizer'):
-            self.fit([query])
+        (features['length'], features['word_count'],
+         features['avg_word_length'], features['special_char_ratio']) = self._basic_features(query)
+        
+        # Semantic features - fit once enough warmup queries have been collected
+        if not self._fitted:
+            self._warmup_queries.append(query)
+            if len(self._warmup_queries) >= self.min_fit_samples:
+                try:
+                    self.fit(self._warmup_queries)
+                except ValueError:
+                    # e.g. only stop words so far; keep a bounded window and retry later
+                    del self._warmup_queries[:-self.min_fit_samples]
             
-        if hasattr(self, 'vectorizer') and self._fitted:
-            features['tfidf'] = self.vectorizer.transform([query]).toarray()[0]
+        if self._fitted:
+            features['tfidf_sparse'] = self._tfidf_cached(query)
         
         return features
     
+    def build_vector_into(self, query, out):
+        """
+        Write a query's numerical feature vector straight into a caller-owned buffer.
+        
+        Unlike transform, no feature dict is built and the vectorizer warmup is untouched.
+        
+        Args:
+            query: The query string
+            out: Array of at least 4 elements; columns past 4 take the TF-IDF entries
+                that fit and are otherwise zeroed
+            
+        Returns:
+            out
+        """
+        out[:4] = self._basic_features(query)
+        out[4:] = 0
+        
+        # Scatter the non-zero TF-IDF entries that fit, if available
+        if self._fitted and out.shape[0] > 4:
+            tfidf = self._tfidf_cached(query)
+            in_range = tfidf.indices < out.shape[0] - 4
+            out[4 + tfidf.indices[in_range]] = tfidf.data[in_range]
+            
+        return out
+        
     def extract_numerical_features(self, features_dict):
         """Convert feature dictionary to numerical array for anomaly detection"""
-        numerical_features = [
-            features_dict.get('length', 0),
-            features_dict.get('word_count', 0),
-            features_dict.get('avg_word_length', 0),
-            features_dict.get('special_char_ratio', 0)
-        ]
-        
-        # Add TF-IDF features if available
-        if 'tfidf' in features_dict and isinstance(features_dict['tfidf'], np.ndarray):
-            numerical_features.extend(features_dict['tfidf'])
+        tfidf = features_dict.get('tfidf_sparse')
+        numerical_features = np.zeros(4 + (tfidf.shape[1] if tfidf is not None else 0))
+        numerical_features[:4] = _BASIC_GET(features_dict)
+        
+        # Scatter the non-zero TF-IDF entries if available
+        if tfidf is not None:
+            numerical_features[4 + tfidf.indices] = tfidf.data
             
-        return np.array(numerical_features) 
\ No newline at end of file
+        return numerical_features 
\ No newline at end of file
@@ -3,11 +3,112 @@ Logging utilities for query processing.
 Provides comprehensive logging of query processing events.
 """
 
+import copy
 import logging
-import json
+import logging.handlers
 import os
-from datetime import datetime
+import queue
+import threading
+import orjson
 
+def _dumps(obj):
+    """Serialize log data to a JSON string (NumPy values handled natively)"""
+    return orjson.dumps(obj, default=str, option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS).decode()
+
+class JsonFormatter(logging.Formatter):
+    """Formatter that renders each record as one JSON object, merging in its structured log_data."""
+    
+    def format(self, record):
+        entry = {
+            'time': self.formatTime(record),
+            'level': record.levelname,
+            'event': record.getMessage()
+        }
+        log_data = getattr(record, 'log_data', None)
+        if log_data is not None:
+            entry.update(log_data)
+        # Records from the queue carry the traceback pre-rendered in exc_text
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry['exc_info'] = record.exc_text
+        return _dumps(entry)
+        
+class StructuredQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that keeps a record's traceback in exc_text rather than folding it into the message."""
+    
+    def prepare(self, record):
+        """Merge args into the message and render exc_info to text before enqueuing"""
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info and not record.exc_text:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+        # Traceback objects are dropped so the record is safe to hand to another thread
+        record.exc_info = None
+        return record
+        
+class BatchingFileHandler(logging.FileHandler):
+    """File handler that coalesces records into one write per batch."""
+    
+    def __init__(self, filename, batch_size=32, flush_interval=0.05, **kwargs):
+        """
+        Initialize the handler.
+        
+        Args:
+            filename: Path to log file
+            batch_size: Number of buffered records that triggers a write
+            flush_interval: Maximum age in seconds of a buffered record
+        """
+        super().__init__(filename, **kwargs)
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._buffer = []
+        self._stop = threading.Event()
+        self._flusher = threading.Thread(target=self._flush_loop, name="log-batch-flusher", daemon=True)
+        self._flusher.start()
+        
+    def emit(self, record):
+        """Buffer a formatted record, writing the batch once it is full"""
+        try:
+            self._buffer.append(self.format(record) + self.terminator)
+            if len(self._buffer) >= self.batch_size:
+                self._write_buffer()
+        except Exception:
+            self.handleError(record)
+            
+    def _write_buffer(self):
+        """Write all buffered records with a single call (caller holds the lock)"""
+        if not self._buffer:
+            return
+            
+        if self.stream is None:
+            self.stream = self._open()
+        self.stream.write(''.join(self._buffer))
+        self.stream.flush()
+        self._buffer.clear()
+        
+    def _flush_loop(self):
+        """Write partial batches once they reach flush_interval in age"""
+        while not self._stop.wait(self.flush_interval):
+            self.flush()
+            
+    def flush(self):
+        """Write any buffered records"""
+        self.acquire()
+        try:
+            self._write_buffer()
+        finally:
+            self.release()
+            
+    def close(self):
+        """Stop the flusher thread and write remaining records"""
+        self._stop.set()
+        if self._flusher.is_alive() and self._flusher is not threading.current_thread():
+            self._flusher.join()
+        self.flush()
+        super().close()
+        
 class QueryLogger:
     def __init__(self, log_file=None, log_level=logging.INFO):
         """
@@ -21,15 +122,15 @@ class QueryLogger:
         self.logger = logging.getLogger("query_processor")
         self.logger.setLevel(log_level)
         
-        # Create formatters
-        console_formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
-        file_formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+        # Create formatters: short human-readable lines on the console, JSON lines in the file
+        console_formatter = logging.Formatter('%(asctime)s %(levelname)s %(message)s')
+        file_formatter = JsonFormatter()
         
         # Add console handler
         console_handler = logging.StreamHandler()
         console_handler.setLevel(log_level)
         console_handler.setFormatter(console_formatter)
-        self.logger.addHandler(console_handler)
+        self.handlers = [console_handler]
         
         # Add file handler if log_file provided
         if log_file:
@@ -38,10 +139,29 @@ class QueryLogger:
             if log_dir:
                 os.makedirs(log_dir, exist_ok=True)
                 
-            file_handler = logging.FileHandler(log_file)
+            file_handler = BatchingFileHandler(log_file)
             file_handler.setLevel(log_level)
             file_handler.setFormatter(file_formatter)
-            self.logger.addHandler(file_handler)
+            self.handlers.append(file_handler)
+            
+        # Callers only enqueue records; formatting and I/O run on the listener thread
+        self._queue = queue.Queue(-1)
+        self._queue_handler = StructuredQueueHandler(self._queue)
+        self.logger.addHandler(self._queue_handler)
+        self._listener = logging.handlers.QueueListener(self._queue, *self.handlers,
+                                                        respect_handler_level=True)
+        self._listener.start()
+        
+    def close(self):
+        """Flush queued records and stop the background listener"""
+        if self._listener is None:
+            return
+            
+        self.logger.removeHandler(self._queue_handler)
+        self._listener.stop()
+        self._listener = None
+        for handler in self.handlers:
+            handler.close()
     
     def log_query(self, query, features, selected_model, response_time, error=None):
         """
@@ -59,7 +179,6 @@ class QueryLogger:
         """
         # Create log data dictionary
         log_data = {
-            'timestamp': datetime.now().isoformat(),
             'query': query[:100],  # Truncate for privacy
             'query_length': len(query),
             'word_count': features.get('word_count', 0),
@@ -69,11 +188,12 @@ class QueryLogger:
             'error': str(error) if error else None
         }
         
-        # Log appropriate message
+        # Log appropriate message; JSON encoding is left to the file formatter
         if error:
-            self.logger.error(f"Query processing error: {json.dumps(log_data)}")
-        else:
-            self.logger.info(f"Query processed: {json.dumps(log_data)}")
+            if self.logger.isEnabledFor(logging.ERROR):
+                self.logger.error("Query processing error", extra={'log_data': log_data})
+        elif self.logger.isEnabledFor(logging.INFO):
+            self.logger.info("Query processed", extra={'log_data': log_data})
         
         return log_data
         
@@ -90,15 +210,15 @@ class QueryLogger:
             Dictionary of log data
         """
         log_data = {
-            'timestamp': datetime.now().isoformat(),
             'event_type': event_type,
             'message': message,
             'data': data
         }
         
         if event_type == 'error':
-            self.logger.error(f"System event: {json.dumps(log_data)}")
-        else:
-            self.logger.info(f"System event: {json.dumps(log_data)}")
+            if self.logger.isEnabledFor(logging.ERROR):
+                self.logger.error("System event", extra={'log_data': log_data})
+        elif self.logger.isEnabledFor(logging.INFO):
+            self.logger.info("System event", extra={'log_data': log_data})
             
         return log_data 
\ No newline at end of file
@@ -3,17 +3,21 @@ Main module for Microsoft Advanced Query Processor.
 Provides the QueryProcessor class and CLI interface.
 """
 
-from rich.console import Console
-from rich.panel import Panel
-from rich.table import Table
-import ollama
 import time
 import argparse
 import os
 import json
+import queue
 import signal
 import sys
+import threading
+import numpy as np
+import orjson
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime
+from functools import cached_property
+from pathlib import Path
 
 # Import our modules
 from .feature_extraction import FeatureExtractor
@@ -23,16 +27,29 @@ from .logging_utils import QueryLogger
 from .cache import QueryCache
 from .monitoring import PerformanceMonitor
 
-# Optional Azure integration
-try:
-    from .azure_integration import (
-        AzureStorageManager, 
-        AzureAnomalyDetection, 
-        AzureLogAnalytics, 
-        AZURE_AVAILABLE
-    )
-except ImportError:
-    AZURE_AVAILABLE = False
+def _load_azure_integration():
+    """Import the optional Azure integration on first use; None if its SDKs are missing"""
+    try:
+        from . import azure_integration
+    except ImportError:
+        return None
+    return azure_integration if azure_integration.AZURE_AVAILABLE else None
+
+def _merge_defaults(config, defaults):
+    """Recursively fill keys missing from config with values from defaults"""
+    for key, value in defaults.items():
+        if isinstance(value, dict) and isinstance(config.get(key, {}), dict):
+            _merge_defaults(config.setdefault(key, {}), value)
+        else:
+            config.setdefault(key, value)
+    return config
+    
+# Azure log uploads are sent in batches of up to this many entries...
+AZURE_LOG_BATCH_SIZE = 500
+# ...or once the oldest queued entry has waited this many seconds
+AZURE_LOG_FLUSH_INTERVAL = 2.0
+# Minimum seconds between uploads of the refitted anomaly detector
+AZURE_MODEL_UPLOAD_INTERVAL = 600
 
 class QueryProcessor:
     def __init__(self, config_path=None):
@@ -40,13 +57,12 @@ class QueryProcessor:
         Initialize the query processor.
         
         Args:
-            config_path: Path to configuration file (optional)
+            config_path: Path to configuration file, or a configuration dictionary (optional)
         """
         # Load configuration
         self.config = self._load_config(config_path)
         
         # Initialize components
-        self.console = Console()
         self.feature_extractor = FeatureExtractor(self.config.get('feature_extraction', {}))
         self.anomaly_detector = MultiModalAnomalyDetector(self.config.get('anomaly_detection', {}))
         self.model_router = SmartModelRouter(
@@ -72,36 +88,64 @@ class QueryProcessor:
         # Start monitoring
         self.monitor.start_monitoring(interval=self.config.get('monitoring', {}).get('interval', 60))
         
-        # Log startup
-        self.logger.log_system_event('startup', 'Query processor initialized', 
-                                     {'config': self.config, 'azure_available': AZURE_AVAILABLE})
+        # Sliding window of recent queries for anomaly detection
+        self.query_history = deque(maxlen=100)
+        self._queries_since_fit = 0
+        
+        # Only a refitted detector is uploaded, at most once per AZURE_MODEL_UPLOAD_INTERVAL
+        self._detector_dirty = False
+        self._last_model_upload = None
+        self._model_upload_lock = threading.Lock()
+        
+        # Shared worker pool so model round-trips for concurrent queries overlap
+        self._pool = ThreadPoolExecutor(max_workers=self.config['processing'].get('max_workers', 8))
+        # Feature extraction, history updates and detector refits are not thread-safe
+        self._anomaly_lock = threading.Lock()
         
-        # Query history for anomaly detection
-        self.query_history = []
+        # Reusable feature vector for fast_score; the detector only scores the 4 basic features
+        self._scratch_buffer = np.zeros(4, dtype=np.float32)
         
-        # Optional Azure integration
+        # Optional Azure integration, only imported when enabled
         self.azure_enabled = False
-        if AZURE_AVAILABLE and self.config.get('azure', {}).get('enabled', False):
+        azure = _load_azure_integration() if self.config.get('azure', {}).get('enabled', False) else None
+        if azure is not None:
             try:
-                self.azure_storage = AzureStorageManager(
+                self.azure_storage = azure.AzureStorageManager(
                     self.config.get('azure', {}).get('storage_connection_string')
                 )
-                self.azure_anomaly = AzureAnomalyDetection(
+                self.azure_anomaly = azure.AzureAnomalyDetection(
                     self.config.get('azure', {}).get('anomaly_endpoint'),
                     self.config.get('azure', {}).get('anomaly_key')
                 )
-                self.azure_logs = AzureLogAnalytics(
+                self.azure_logs = azure.AzureLogAnalytics(
                     self.config.get('azure', {}).get('log_analytics_workspace_id')
                 )
                 self.azure_enabled = True
                 self.logger.log_system_event('info', 'Azure integration enabled')
             except Exception as e:
                 self.logger.log_system_event('error', 'Azure integration failed', {'error': str(e)})
+                
+        # Azure log entries are uploaded in batches from a background thread
+        self._azure_queue = queue.Queue()
+        self._azure_flusher = None
+        if self.azure_enabled:
+            self._azure_flusher = threading.Thread(target=self._flush_azure_logs, daemon=True)
+            self._azure_flusher.start()
         
+        # Log startup
+        self.logger.log_system_event('startup', 'Query processor initialized', 
+                                     {'config': self.config, 'azure_enabled': self.azure_enabled})
+                                     
         # Register signal handlers for graceful shutdown
         signal.signal(signal.SIGINT, self._signal_handler)
         signal.signal(signal.SIGTERM, self._signal_handler)
         
+    @cached_property
+    def console(self):
+        """Rich console, created on first use so library callers never import rich"""
+        from rich.console import Console
+        return Console()
+        
     def _signal_handler(self, sig, frame):
         """Handle shutdown signals"""
         self.console.print("\n[yellow]Shutting down gracefully...[/]")
@@ -110,16 +154,53 @@ class QueryProcessor:
         
     def shutdown(self):
         """Clean shutdown of the processor"""
+        self._pool.shutdown(wait=True)
         self.monitor.stop_monitoring()
         self.logger.log_system_event('shutdown', 'Query processor shutting down', 
                                     {'stats': self.monitor.get_summary_stats()})
+                                    
+        # Drain pending Azure log entries before stopping
+        if self._azure_flusher is not None:
+            self._azure_queue.put(None)
+            self._azure_flusher.join(timeout=10)
+            self._azure_flusher = None
+            
+        self.cache.close()
+        self.logger.close()
+        
+    def _flush_azure_logs(self):
+        """Upload queued Azure log entries in batches until a None sentinel arrives"""
+        while True:
+            batch = [self._azure_queue.get()]
+            deadline = time.monotonic() + AZURE_LOG_FLUSH_INTERVAL
+            while batch[-1] is not None and len(batch) < AZURE_LOG_BATCH_SIZE:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(self._azure_queue.get(timeout=timeout))
+                except queue.Empty:
+                    break
+                    
+            stopping = batch[-1] is None
+            if stopping:
+                batch.pop()
+                
+            if batch:
+                try:
+                    self.azure_logs.send_logs(batch)
+                except Exception as e:
+                    self.logger.log_system_event('error', 'Failed to send logs to Azure', {'error': str(e)})
+                    
+            if stopping:
+                return
         
     def _load_config(self, config_path):
         """
         Load configuration from file or use defaults.
         
         Args:
-            config_path: Path to configuration file
+            config_path: Path to configuration file, or a configuration dictionary
             
         Returns:
             Configuration dictionary
@@ -131,7 +212,8 @@ class QueryProcessor:
             },
             'anomaly_detection': {
                 'contamination': 0.1,
-                'n_estimators': 100
+                'n_estimators': 100,
+                'refit_every': 50
             },
             'models': {
                 'simple': {'model': 'mistral', 'threshold': 0.3, 'min_complexity': 0, 'resource_intensity': 1},
@@ -149,38 +231,77 @@ class QueryProcessor:
             'monitoring': {
                 'interval': 60
             },
+            'processing': {
+                'max_workers': 8
+            },
             'azure': {
                 'enabled': False
             }
         }
         
-        if not config_path or not os.path.exists(config_path):
+        if not config_path:
             return default_config
             
         try:
-            with open(config_path, 'r') as f:
-                config = json.load(f)
+            if isinstance(config_path, dict):
+                config = config_path
+            else:
+                config = orjson.loads(Path(config_path).read_bytes())
                 
             # Merge with defaults to ensure all keys exist
-            for section in default_config:
-                if section not in config:
-                    config[section] = default_config[section]
-                elif isinstance(default_config[section], dict):
-                    for key in default_config[section]:
-                        if key not in config[section]:
-                            config[section][key] = default_config[section][key]
-                            
-            return config
+            return _merge_defaults(config, default_config)
+        except FileNotFoundError:
+            return default_config
         except Exception as e:
             self.console.print(f"[yellow]Warning: Failed to load config: {str(e)}. Using defaults.[/]")
             return default_config
             
-    def process_query(self, query):
+    def _maybe_refit(self, new_queries):
+        """
+        Refit the anomaly detector on the history window every refit_every queries.
+        
+        The first fit happens as soon as 20 queries have been seen.
+        
+        Args:
+            new_queries: Number of queries just added to the history
+        """
+        self._queries_since_fit += new_queries
+        if len(self.query_history) < 20:
+            return
+            
+        refit_every = self.config['anomaly_detection'].get('refit_every', 50)
+        if not self.anomaly_detector.fitted or self._queries_since_fit >= refit_every:
+            self.anomaly_detector.fit(list(self.query_history))
+            self._queries_since_fit = 0
+            self._detector_dirty = self._detector_dirty or self.anomaly_detector.fitted
+            
+    def _maybe_upload_model(self):
+        """Upload the anomaly detector to Azure if it was refitted and the upload interval has passed"""
+        with self._model_upload_lock:
+            now = time.monotonic()
+            if not self._detector_dirty or (self._last_model_upload is not None and
+                                            now - self._last_model_upload < AZURE_MODEL_UPLOAD_INTERVAL):
+                return
+            self._detector_dirty = False
+            self._last_model_upload = now
+            
+        model_name = f"anomaly_detector_{datetime.now().strftime('%Y%m%d_%H%M%S')}.pkl"
+        try:
+            self.azure_storage.save_model(
+                self.anomaly_detector.detector, 
+                "query-processor-models", 
+                model_name
+            )
+        except Exception as e:
+            self.logger.log_system_event('error', 'Failed to save model to Azure', {'error': str(e)})
+            
+    def process_query(self, query, features=None):
         """
         Process a single query through the pipeline.
         
         Args:
             query: The query string
+            features: Precomputed features including 'anomaly_score' (optional)
             
         Returns:
             Dictionary with processing results
@@ -191,53 +312,58 @@ class QueryProcessor:
         selected_model = None
         is_cached = False
         
-        try:
-            # Extract features
-            features = self.feature_extractor.transform(query)
-            
-            # Store for anomaly detection
-            self.query_history.append(features)
-            
-            # Detect anomalies if enough history
-            if len(self.query_history) >= 20:
-                self.anomaly_detector.fit(self.query_history[-100:])
+        # Hashed once for the cache probe, the cache store and the Azure log entry
+        query_digest = self.cache.query_digest(query)
+        
+        if features is None:
+            try:
+                with self._anomaly_lock:
+                    # Extract features
+                    features = self.feature_extractor.transform(query)
+                    
+                    # Store for anomaly detection
+                    self.query_history.append(features)
+                    self._maybe_refit(1)
+                    
+                    anomaly_score = self.anomaly_detector.score_anomaly(features)
+                features['anomaly_score'] = anomaly_score
+            except Exception as e:
+                # Without features the query cannot be routed
+                features = features or {}
+                error = e
                 
-            anomaly_score = self.anomaly_detector.score_anomaly(features)
-            features['anomaly_score'] = anomaly_score
-            
-            # Select appropriate model
-            selected_model = self.model_router.select_model(features)
-            
-            # Check cache first
-            cached_response = self.cache.get(query, selected_model)
+        if error is None:
+            try:
+                # Select appropriate model
+                selected_model = self.model_router.select_model(features, now=start_time)
+                
+                # Check cache first
+                cached_response = self.cache.get(query, selected_model, query_digest=query_digest)
+            except Exception as e:
+                error = e
+                
+        if error is None:
             if cached_response:
                 response = cached_response
                 is_cached = True
             else:
-                # Generate response with the selected model
-                ollama_response = ollama.generate(model=selected_model, prompt=query)
-                response = ollama_response['response']
-                
-                # Cache the response
-                self.cache.set(query, selected_model, response)
-                
-            # Azure integration if enabled
-            if self.azure_enabled and not is_cached:
-                # Upload model to Azure if it was new
-                if hasattr(self, 'azure_storage') and hasattr(self.anomaly_detector, 'detector'):
-                    model_name = f"anomaly_detector_{datetime.now().strftime('%Y%m%d_%H%M%S')}.pkl"
-                    try:
-                        self.azure_storage.save_model(
-                            self.anomaly_detector.detector, 
-                            "query-processor-models", 
-                            model_name
-                        )
-                    except Exception as e:
-                        self.logger.log_system_event('error', 'Failed to save model to Azure', {'error': str(e)})
-                
-        except Exception as e:
-            error = e
-            response = f"Error processing query: {str(e)}"
+                try:
+                    # Generate response with the selected model
+                    import ollama
+                    ollama_response = ollama.generate(model=selected_model, prompt=query)
+                    response = ollama_response['response']
+                except Exception as e:
+                    error = e
+                else:
+                    # Cache the response
+                    self.cache.set(query, selected_model, response, query_digest=query_digest)
+                    
+                    # Upload model to Azure if it was refitted
+                    if self.azure_enabled and hasattr(self, 'azure_storage') and hasattr(self.anomaly_detector, 'detector'):
+                        self._maybe_upload_model()
+                        
+        if error is not None:
+            response = f"Error processing query: {str(error)}"
             
         # Calculate total processing time
         processing_time = time.time() - start_time
@@ -250,15 +376,17 @@ class QueryProcessor:
             try:
                 log_entry = {
                     'QueryText': query[:100],
+                    # Same digest that keys the response cache, so log rows can be matched to cache entries
+                    'QueryHash': query_digest.hex(),
                     'SelectedModel': selected_model,
                     'ResponseTime': processing_time,
                     'AnomalyScore': features.get('anomaly_score', 0),
                     'IsError': error is not None,
                     'IsCached': is_cached
                 }
-                self.azure_logs.send_logs([log_entry])
+                self._azure_queue.put(log_entry)
             except Exception as e:
-                self.logger.log_system_event('error', 'Failed to send logs to Azure', {'error': str(e)})
+                self.logger.log_system_event('error', 'Failed to queue logs for Azure', {'error': str(e)})
         
         # Update performance metrics
         self.monitor.record_query(selected_model, processing_time, error is None)
@@ -274,6 +402,81 @@ class QueryProcessor:
             'error': str(error) if error else None
         }
         
+    def process_query_async(self, query, features=None):
+        """
+        Submit a query to the shared worker pool.
+        
+        Args:
+            query: The query string
+            features: Precomputed features including 'anomaly_score' (optional)
+            
+        Returns:
+            Future resolving to the process_query result dictionary
+        """
+        return self._pool.submit(self.process_query, query, features)
+        
+    def process_queries(self, queries, progress_callback=None):
+        """
+        Process several queries, scoring anomalies for all of them in one batch.
+        
+        Model calls for the batch run concurrently on the shared worker pool so
+        their round-trips overlap.
+        
+        Args:
+            queries: List of query strings
+            progress_callback: Called with each result as it completes (optional)
+            
+        Returns:
+            List of result dictionaries, in the same order as queries
+        """
+        try:
+            with self._anomaly_lock:
+                features_list = [self.feature_extractor.transform(query) for query in queries]
+                self.query_history.extend(features_list)
+                self._maybe_refit(len(features_list))
+                
+                scores = self.anomaly_detector.score_anomaly_batch(features_list)
+            for features, anomaly_score in zip(features_list, scores):
+                features['anomaly_score'] = anomaly_score
+        except Exception:
+            # Fall back to the per-query path, which reports errors per query
+            results = []
+            for query in queries:
+                results.append(self.process_query(query))
+                if progress_callback:
+                    progress_callback(results[-1])
+            return results
+            
+        results = [None] * len(queries)
+        futures = {
+            self.process_query_async(query, features): i
+            for i, (query, features) in enumerate(zip(queries, features_list))
+        }
+        for future in as_completed(futures):
+            results[futures[future]] = future.result()
+            if progress_callback:
+                progress_callback(future.result())
+                
+        return results
+        
+    def fast_score(self, query):
+        """
+        Anomaly score for a query, going straight from text to detector.
+        
+        The basic features are written into a reusable buffer that the detector
+        standardizes in place; no feature dict is built and query history is not updated.
+        
+        Args:
+            query: The query string
+            
+        Returns:
+            Anomaly score
+        """
+        # The buffer and the detector's history are shared with the worker pool
+        with self._anomaly_lock:
+            self.feature_extractor.build_vector_into(query, self._scratch_buffer)
+            return self.anomaly_detector.score_vector(self._scratch_buffer)
+        
     def display_results(self, results):
         """
         Display processing results in a rich table.
@@ -281,6 +484,9 @@ class QueryProcessor:
         Args:
             results: Dictionary with processing results
         """
+        from rich.panel import Panel
+        from rich.table import Table
+        
         table = Table(show_header=True, header_style="bold magenta")
         table.add_column("Metric", style="cyan")
         table.add_column("Value")
@@ -303,6 +509,9 @@ class QueryProcessor:
         
     def display_system_stats(self):
         """Display system performance statistics"""
+        from rich.panel import Panel
+        from rich.table import Table
+        
         stats = self.monitor.get_summary_stats()
         
         table = Table(show_header=True, header_style="bold blue")
@@ -335,6 +544,8 @@ class QueryProcessor:
         
     def interactive_mode(self):
         """Run in interactive console mode"""
+        from rich.panel import Panel
+        
         self.console.print(Panel("[bold cyan]Microsoft Advanced Query Processor[/]\nProduction-Ready Version", width=80))
         
         if self.azure_enabled:
@@ -393,13 +604,17 @@ def main():
             print(f"Error loading config: {e}")
             config = None
     
-    processor = QueryProcessor(config_path=args.config)
+    processor = QueryProcessor(config_path=config if config is not None else args.config)
     
     if args.query:
-        results = processor.process_query(args.query)
-        processor.display_results(results)
-        print("\nResponse:")
-        print(results['response'])
+        try:
+            results = processor.process_query(args.query)
+            processor.display_results(results)
+            print("\nResponse:")
+            print(results['response'])
+        finally:
+            # Drain logs, the Azure queue and the cache before exiting
+            processor.shutdown()
     else:
         processor.interactive_mode()
 
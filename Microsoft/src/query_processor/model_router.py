@@ -4,65 +4,79 @@ Selects the appropriate model based on query features and system metrics.
 """
 
 import time
+from collections import Counter, deque
+import numpy as np
 
+def _score_models(word_count, anomaly_score, min_complexity, threshold, intensity, load):
+    """
+    Score every model and return the index of the best one.
+    
+    Models get +1 when the query meets their complexity requirement, +2 when it
+    crosses their anomaly threshold and -3 when intensity * load exceeds 0.8.
+    Ties go to the lowest index.
+    """
+    best = 0
+    best_score = -4
+    for i in range(min_complexity.shape[0]):
+        score = 0
+        if word_count >= min_complexity[i]:
+            score += 1
+        if anomaly_score >= threshold[i]:
+            score += 2
+        if intensity[i] * load > 0.8:
+            score -= 3
+        if score > best_score:
+            best = i
+            best_score = score
+    return best
+    
 class SmartModelRouter:
-    def __init__(self, model_config=None):
+    def __init__(self, model_config=None, history_size=1024):
         self.model_config = model_config or {
             'simple': {'model': 'mistral', 'threshold': 0.3, 'min_complexity': 0, 'resource_intensity': 1},
             'technical': {'model': 'llama2', 'threshold': 0.5, 'min_complexity': 10, 'resource_intensity': 3},
             'analytical': {'model': 'codeqwen', 'threshold': 0.6, 'min_complexity': 15, 'resource_intensity': 5}
         }
         self.default_model = 'mistral'
-        self.routing_history = []
+        # Recent (selected_model, timestamp) decisions
+        self.routing_history = deque(maxlen=history_size)
         
-    def select_model(self, query_features, system_metrics=None):
+        # Model parameters laid out column-wise so scoring is a few vector ops
+        configs = list(self.model_config.values())
+        self._names = list(self.model_config.keys())
+        self._min_complexity = np.array([c.get('min_complexity', 0) for c in configs], dtype=np.int64)
+        self._threshold = np.array([c.get('threshold', 0) for c in configs], dtype=np.float64)
+        self._intensity = np.array([c.get('resource_intensity', 1) for c in configs], dtype=np.float64)
+        
+    def select_model(self, query_features, system_metrics=None, now=None):
         """
         Select the most appropriate model for a query based on features and system metrics.
         
         Args:
             query_features: Dictionary containing query features
             system_metrics: Optional dict with system metrics like current_load
+            now: Timestamp of the decision; defaults to time.time()
             
         Returns:
             model_name: String identifier of the selected model
         """
-        scores = {}
-        
-        # Calculate scores for each model
-        for model_name, model_config in self.model_config.items():
-            scores[model_name] = 0
+        if not self._names:
+            return self.default_model
             
-            # Score based on complexity requirements
-            if query_features.get('word_count', 0) >= model_config.get('min_complexity', 0):
-                scores[model_name] += 1
-                
-            # Score based on anomaly threshold
-            anomaly_score = query_features.get('anomaly_score', 0)
-            if anomaly_score >= model_config.get('threshold', 0):
-                scores[model_name] += 2
-                
-            # Consider system load if available
-            if system_metrics and 'current_load' in system_metrics:
-                load_penalty = model_config.get('resource_intensity', 1) * system_metrics['current_load']
-                if load_penalty > 0.8:  # High load situation
-                    scores[model_name] -= 3  # Penalize resource-intensive models under load
+        # Resource-intensive models are only penalized when the load is known
+        load = system_metrics.get('current_load', 0.0) if system_metrics else 0.0
         
-        # Select highest scoring model or fall back to default
-        if scores:
-            selected_model = max(scores.items(), key=lambda x: x[1])[0]
-        else:
-            selected_model = self.default_model
+        # Highest scoring model, first in config order on ties
+        best = _score_models(int(query_features.get('word_count', 0)),
+                             float(query_features.get('anomaly_score', 0)),
+                             self._min_complexity, self._threshold, self._intensity, float(load))
+        selected_model = self._names[best]
         
         # Get actual model name from config
         model_name = self.model_config[selected_model].get('model', selected_model)
         
         # Record selection for analysis
-        self.routing_history.append({
-            'features': query_features,
-            'selected_model': selected_model,
-            'scores': scores,
-            'timestamp': time.time()
-        })
+        self.routing_history.append((selected_model, now if now is not None else time.time()))
         
         return model_name
         
@@ -72,18 +86,13 @@ class SmartModelRouter:
             return {}
             
         # Calculate model distribution
-        model_counts = {}
-        for record in self.routing_history:
-            model = record['selected_model']
-            if model not in model_counts:
-                model_counts[model] = 0
-            model_counts[model] += 1
-            
+        model_counts = Counter(model for model, _ in self.routing_history)
+        
         total = len(self.routing_history)
         model_distribution = {model: count/total for model, count in model_counts.items()}
         
         return {
             'total_decisions': total,
             'model_distribution': model_distribution,
-            'latest_timestamp': self.routing_history[-1]['timestamp'] if self.routing_history else None
+            'latest_timestamp': self.routing_history[-1][1]
         } 
\ No newline at end of file
@@ -4,10 +4,15 @@ Tracks performance metrics and system health.
 """
 
 import time
-from collections import deque
+from collections import Counter, deque
 import threading
 import numpy as np
-import psutil
+
+# Number of system metric snapshots kept
+SYSTEM_HISTORY_SIZE = 1000
+
+# Disk usage changes slowly; only re-read it every this many monitoring ticks
+DISK_REFRESH_EVERY = 10
 
 class PerformanceMonitor:
     def __init__(self, window_size=100):
@@ -19,12 +24,21 @@ class PerformanceMonitor:
         """
         self.metrics = {
             'response_times': deque(maxlen=window_size),
-            'model_usage': {},
+            'model_usage': Counter(),
             'error_count': 0,
             'total_queries': 0,
-            'start_time': time.time(),
-            'system_metrics': []
+            'start_time': time.time()
+        }
+        
+        # System metric snapshots as one ring buffer per metric
+        self._sys = {
+            'cpu_percent': np.empty(SYSTEM_HISTORY_SIZE, dtype=np.float32),
+            'memory_percent': np.empty(SYSTEM_HISTORY_SIZE, dtype=np.float32),
+            'disk_percent': np.empty(SYSTEM_HISTORY_SIZE, dtype=np.float32),
+            'timestamp': np.empty(SYSTEM_HISTORY_SIZE, dtype=np.float64)
         }
+        self._sys_head = 0
+        self._disk_percent = None
         self.lock = threading.Lock()
         self.monitoring_thread = None
         self.monitoring_active = False
@@ -43,19 +57,28 @@ class PerformanceMonitor:
             self.metrics['response_times'].append(response_time)
             
             # Update model usage counts
-            if model_name not in self.metrics['model_usage']:
-                self.metrics['model_usage'][model_name] = 0
             self.metrics['model_usage'][model_name] += 1
             
             if not success:
                 self.metrics['error_count'] += 1
     
-    def get_system_metrics(self):
-        """Get current system resource metrics"""
+    def get_system_metrics(self, refresh_disk=True):
+        """
+        Get current system resource metrics.
+        
+        Args:
+            refresh_disk: Re-read disk usage instead of reusing the last reading
+        """
+        # Only the monitoring thread needs psutil
+        import psutil
+        
+        if refresh_disk or self._disk_percent is None:
+            self._disk_percent = psutil.disk_usage('/').percent
+            
         return {
             'cpu_percent': psutil.cpu_percent(),
             'memory_percent': psutil.virtual_memory().percent,
-            'disk_percent': psutil.disk_usage('/').percent,
+            'disk_percent': self._disk_percent,
             'timestamp': time.time()
         }
         
@@ -72,20 +95,23 @@ class PerformanceMonitor:
         self.monitoring_active = True
         
         def monitor_loop():
+            tick = 0
             while self.monitoring_active:
+                started = time.monotonic()
                 try:
-                    metrics = self.get_system_metrics()
+                    metrics = self.get_system_metrics(refresh_disk=tick % DISK_REFRESH_EVERY == 0)
                     with self.lock:
-                        self.metrics['system_metrics'].append(metrics)
+                        idx = self._sys_head % SYSTEM_HISTORY_SIZE
+                        for key, buf in self._sys.items():
+                            buf[idx] = metrics[key]
+                        self._sys_head += 1
                         
-                        # Trim system metrics if too many
-                        if len(self.metrics['system_metrics']) > 1000:
-                            self.metrics['system_metrics'] = self.metrics['system_metrics'][-1000:]
-                            
                 except Exception as e:
                     print(f"Error monitoring system metrics: {e}")
                     
-                time.sleep(interval)
+                # Sleep out the rest of the interval so sampling does not drift
+                tick += 1
+                time.sleep(max(0.0, interval - (time.monotonic() - started)))
                 
         self.monitoring_thread = threading.Thread(target=monitor_loop, daemon=True)
         self.monitoring_thread.start()
@@ -105,22 +131,28 @@ class PerformanceMonitor:
         """
         with self.lock:
             uptime_seconds = time.time() - self.metrics['start_time']
-            response_times = list(self.metrics['response_times'])
+            response_times = self.metrics['response_times']
+            rt = np.fromiter(response_times, dtype=np.float32, count=len(response_times))
             
             # Calculate model distribution
-            model_distribution = {}
             total_queries = self.metrics['total_queries']
-            if total_queries > 0:
-                for model, count in self.metrics['model_usage'].items():
-                    model_distribution[model] = count / total_queries
+            model_distribution = {model: count / total_queries
+                                  for model, count in self.metrics['model_usage'].most_common()}
             
             # Calculate system metrics averages if available
             system_avg = {}
-            if self.metrics['system_metrics']:
-                metrics_keys = [k for k in self.metrics['system_metrics'][0].keys() if k != 'timestamp']
-                for key in metrics_keys:
-                    values = [m[key] for m in self.metrics['system_metrics']]
-                    system_avg[key] = np.mean(values)
+            n_sys = min(self._sys_head, SYSTEM_HISTORY_SIZE)
+            if n_sys:
+                for key, buf in self._sys.items():
+                    if key != 'timestamp':
+                        system_avg[key] = float(buf[:n_sys].mean(dtype=np.float64))
+                
+            # Min, median, p95 and max from a single sort of the window
+            if rt.size:
+                rt_min, rt_median, rt_p95, rt_max = np.quantile(rt, [0.0, 0.5, 0.95, 1.0]).tolist()
+                rt_mean = float(rt.mean())
+            else:
+                rt_min = rt_median = rt_p95 = rt_max = rt_mean = 0
             
             stats = {
                 'total_queries': total_queries,
@@ -128,11 +160,11 @@ class PerformanceMonitor:
                 'error_rate': self.metrics['error_count'] / max(1, total_queries),
                 'model_distribution': model_distribution,
                 'response_time': {
-                    'mean': np.mean(response_times) if response_times else 0,
-                    'median': np.median(response_times) if response_times else 0,
-                    'p95': np.percentile(response_times, 95) if response_times else 0,
-                    'min': min(response_times) if response_times else 0,
-                    'max': max(response_times) if response_times else 0
+                    'mean': rt_mean,
+                    'median': rt_median,
+                    'p95': rt_p95,
+                    'min': rt_min,
+                    'max': rt_max
                 },
                 'uptime_hours': uptime_seconds / 3600,
                 'system_metrics': system_avg
@@ -3,11 +3,18 @@ Microsoft 365 integration module for query processing.
 Enables integration with Microsoft 365 services for continuous model improvement.
 """
 
-import json
+import atexit
+import io
+import orjson
 import os
 import logging
+import re
+import threading
 import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
+from urllib.parse import quote, urlencode
 import numpy as np
 import pandas as pd
 
@@ -15,15 +22,102 @@ import pandas as pd
 try:
     import msal
     import requests
-    from azure.identity import DefaultAzureCredential
+    from requests.adapters import HTTPAdapter
+    from urllib3.util.retry import Retry
     MS365_AVAILABLE = True
 except ImportError:
     MS365_AVAILABLE = False
+    
+try:
+    from joblib import Parallel, cpu_count, delayed
+    JOBLIB_AVAILABLE = True
+except ImportError:
+    JOBLIB_AVAILABLE = False
+    
+try:
+    import pyarrow as pa
+    import pyarrow.json as pa_json
+    # Arrow-backed pandas columns need pandas >= 1.5
+    PYARROW_AVAILABLE = hasattr(pd, 'ArrowDtype')
+except ImportError:
+    PYARROW_AVAILABLE = False
 
 logger = logging.getLogger("query_processor.ms365")
 
+# Maximum number of requests Microsoft Graph accepts in one $batch call
+GRAPH_BATCH_LIMIT = 20
+
+# Retries for throttled (429) or transient 5xx Graph responses
+GRAPH_MAX_RETRIES = 5
+GRAPH_RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+# Upper bound on @odata.nextLink pages followed for one listing
+GRAPH_MAX_PAGES = 50
+
+# Base URL that relative Graph endpoint paths are resolved against
+GRAPH_BASE_URL = "https://graph.microsoft.com/v1.0/"
+
+# In-process cache of successful Graph GET responses: lifetime in seconds and entry limit
+GRAPH_CACHE_TTL = 300
+GRAPH_CACHE_SIZE = 256
+
+# Refresh access tokens this many seconds before they actually expire
+TOKEN_REFRESH_MARGIN = 300
+
+# Compact dtypes for collaboration patterns: categories for low-cardinality columns and
+# nullable integer/boolean types for fields only one source has; text and flags are
+# Arrow-backed when pyarrow is installed
+_PATTERN_DTYPES = {'source': 'category', 'importance': 'category',
+                   'text': 'string[pyarrow]' if PYARROW_AVAILABLE else 'string',
+                   'reactions': 'Int32', 'replies': 'Int32',
+                   'has_attachments': 'bool[pyarrow]' if PYARROW_AVAILABLE else 'boolean'}
+
+# Whole whitespace-delimited alphanumeric words longer than 3 characters, compiled once
+_TOKEN_RE = re.compile(r'(?<!\S)[^\W_]{4,}(?!\S)')
+
+# Seconds an insight extractor reuses fetched collaboration patterns
+PATTERNS_CACHE_TTL = 300
+
+# Below this many texts, topic counting stays in-process
+PARALLEL_TOPIC_MIN_ROWS = 50000
+
+# Search insight fields read by extract_query_patterns: Arrow type, column name and
+# default for missing or null values
+_SEARCH_FIELDS = {
+    'queryText': ('string', 'query_text', ''),
+    'resultCount': ('int64', 'result_count', 0),
+    'source': ('string', 'source', 'unknown'),
+    'createdDateTime': ('string', 'timestamp', None)
+}
+
+# Search pattern column dtypes, the same whether or not the frame was built through Arrow
+_SEARCH_DTYPES = {'query_text': 'string', 'result_count': 'int64', 'source': 'string', 'timestamp': 'string'}
+
+# pandas >= 2 infers one timestamp format from the first value unless told the input is ISO 8601
+_ISO8601 = {'format': 'ISO8601'} if int(pd.__version__.split('.')[0]) >= 2 else {}
+
+def _patterns_frame(patterns):
+    """Build a collaboration patterns DataFrame with typed columns"""
+    df = pd.DataFrame(patterns)
+    df = df.astype({col: dtype for col, dtype in _PATTERN_DTYPES.items() if col in df.columns})
+    if 'text' in df.columns:
+        # Missing text is empty text, so string methods never see nulls
+        df['text'] = df['text'].fillna('')
+    if 'timestamp' in df.columns:
+        df['timestamp'] = pd.to_datetime(df['timestamp'], utc=True, errors='coerce', **_ISO8601)
+    return df
+    
+def _count_topics(texts):
+    """Count topic words across a chunk of texts"""
+    counts = Counter()
+    for text in texts:
+        counts.update(_TOKEN_RE.findall(text.lower()))
+    return counts
+    
+
 class MS365Connector:
-    def __init__(self, client_id=None, client_secret=None, tenant_id=None, scopes=None):
+    def __init__(self, client_id=None, client_secret=None, tenant_id=None, scopes=None,
+                 token_cache_path=None, delta_state_path=None):
         """
         Initialize Microsoft 365 connector.
         
@@ -32,10 +126,14 @@ class MS365Connector:
             client_secret: Azure AD application secret (optional)
             tenant_id: Azure AD tenant ID (optional)
             scopes: List of Microsoft Graph API permission scopes
+            token_cache_path: File used to persist the MSAL token cache across
+                processes (optional)
+            delta_state_path: File used to persist Graph delta links across
+                processes (optional)
         """
         if not MS365_AVAILABLE:
             raise ImportError("MS365 SDK packages are not installed. Please install them with: "
-                            "pip install msal azure-identity pandas")
+                            "pip install msal requests pandas")
             
         self.client_id = client_id or os.environ.get("MS365_CLIENT_ID")
         self.client_secret = client_secret or os.environ.get("MS365_CLIENT_SECRET")
@@ -46,35 +144,108 @@ class MS365Connector:
             raise ValueError("Microsoft 365 credentials not provided and environment variables not set")
             
         self.token = None
-        self.token_expiry = None
+        # time.monotonic() deadline, immune to wall-clock adjustments
+        self.token_expiry = 0.0
+        
+        # MSAL token cache, persisted to disk at exit when a path is configured
+        self.token_cache_path = token_cache_path or os.environ.get("MS365_TOKEN_CACHE")
+        self.token_cache = msal.SerializableTokenCache()
+        if self.token_cache_path and os.path.exists(self.token_cache_path):
+            with open(self.token_cache_path, 'r') as f:
+                self.token_cache.deserialize(f.read())
+        if self.token_cache_path:
+            atexit.register(self._save_token_cache)
+        self._app = None
+        
+        # Graph delta links per source, so delta syncs resume where the last one stopped
+        self.delta_state_path = delta_state_path or os.environ.get("MS365_DELTA_STATE")
+        self._delta_links = {}
+        if self.delta_state_path and os.path.exists(self.delta_state_path):
+            with open(self.delta_state_path, 'rb') as f:
+                self._delta_links = orjson.loads(f.read())
+        if self.delta_state_path:
+            atexit.register(self._save_delta_state)
+            
+        # One pooled HTTP session for all Graph calls, so connections and TLS sessions are reused;
+        # throttled and transient failures are retried with backoff, honouring Retry-After
+        retry = Retry(total=GRAPH_MAX_RETRIES, backoff_factor=0.5,
+                      status_forcelist=GRAPH_RETRY_STATUSES,
+                      allowed_methods=frozenset(['GET', 'POST']), raise_on_status=False)
+        adapter = HTTPAdapter(pool_connections=64, pool_maxsize=64, max_retries=retry)
+        self._session = requests.Session()
+        self._session.mount("https://", adapter)
+        self._session.headers.update({'Content-Type': 'application/json'})
+        
+        # Recent Graph GET responses: key -> (expires_at, data), in insertion order
+        self._graph_cache = {}
+        self._graph_cache_lock = threading.Lock()
+        
+    def _save_token_cache(self):
+        """Write the token cache to token_cache_path if it changed"""
+        if not self.token_cache.has_state_changed:
+            return
+            
+        try:
+            # Owner-only permissions since the file holds access tokens
+            fd = os.open(self.token_cache_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+            with os.fdopen(fd, 'w') as f:
+                f.write(self.token_cache.serialize())
+        except OSError as e:
+            logger.error(f"Failed to save token cache: {str(e)}")
+            
+    def _save_delta_state(self):
+        """Write the delta links to delta_state_path"""
+        if not self._delta_links:
+            return
+            
+        try:
+            # Owner-only permissions since delta links carry sync state for the tenant
+            fd = os.open(self.delta_state_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+            with os.fdopen(fd, 'wb') as f:
+                f.write(orjson.dumps(self._delta_links))
+        except OSError as e:
+            logger.error(f"Failed to save delta state: {str(e)}")
+            
+    def _expire_token(self):
+        """Drop the current token after Graph rejected it, forcing get_token to renew"""
+        self.token = None
+        self.token_expiry = 0.0
         
     def get_token(self):
         """
         Authenticate with Microsoft Graph API and get access token.
         
+        Called before every Graph request; while the token's monotonic deadline
+        holds this is a single clock comparison.
+        
         Returns:
             Access token string
         """
-        # Check if existing token is still valid
-        if self.token and self.token_expiry and datetime.now() < self.token_expiry:
+        # Known-fresh token: the deadline is only set once a token was acquired
+        if time.monotonic() < self.token_expiry:
             return self.token
             
         try:
-            # Create MSAL confidential client
-            app = msal.ConfidentialClientApplication(
-                self.client_id,
-                authority=f"https://login.microsoftonline.com/{self.tenant_id}",
-                client_credential=self.client_secret
-            )
-            
-            # Acquire token for client
-            result = app.acquire_token_for_client(scopes=self.scopes)
+            # Create the MSAL confidential client once and reuse it
+            if self._app is None:
+                self._app = msal.ConfidentialClientApplication(
+                    self.client_id,
+                    authority=f"https://login.microsoftonline.com/{self.tenant_id}",
+                    client_credential=self.client_secret,
+                    token_cache=self.token_cache
+                )
+                
+            # Serve from the token cache when possible, otherwise acquire token for client
+            result = self._app.acquire_token_silent(self.scopes, account=None)
+            if not result:
+                result = self._app.acquire_token_for_client(scopes=self.scopes)
             
             if "access_token" in result:
                 self.token = result["access_token"]
-                # Set expiry time (default token lifetime is typically 1 hour)
+                self._session.headers['Authorization'] = f'Bearer {self.token}'
+                # Set expiry time (default token lifetime is typically 1 hour), refreshing early
                 expires_in = result.get("expires_in", 3600)
-                self.token_expiry = datetime.now() + timedelta(seconds=expires_in)
+                self.token_expiry = time.monotonic() + max(0, expires_in - TOKEN_REFRESH_MARGIN)
                 return self.token
             else:
                 error = f"Authentication error: {result.get('error')}: {result.get('error_description')}"
@@ -85,103 +256,361 @@ class MS365Connector:
             logger.error(f"Failed to acquire token: {str(e)}")
             raise
         
-    def get_graph_data(self, endpoint, params=None):
+    @staticmethod
+    def _cache_key(endpoint, params=None, headers=None):
+        """Key a Graph GET by endpoint path, query parameters and extra headers"""
+        if endpoint.startswith(GRAPH_BASE_URL):
+            endpoint = endpoint[len(GRAPH_BASE_URL):]
+        return (endpoint.lstrip('/'), frozenset((params or {}).items()), frozenset((headers or {}).items()))
+        
+    def _cache_get(self, key):
+        """Return a cached Graph response, or None if absent or expired"""
+        with self._graph_cache_lock:
+            entry = self._graph_cache.get(key)
+            if entry is None:
+                return None
+            if entry[0] < time.monotonic():
+                del self._graph_cache[key]
+                return None
+            return entry[1]
+            
+    def _cache_put(self, key, data):
+        """Cache a Graph response, evicting the oldest entry when full"""
+        with self._graph_cache_lock:
+            self._graph_cache.pop(key, None)
+            if len(self._graph_cache) >= GRAPH_CACHE_SIZE:
+                del self._graph_cache[next(iter(self._graph_cache))]
+            self._graph_cache[key] = (time.monotonic() + GRAPH_CACHE_TTL, data)
+            
+    def get_graph_data(self, endpoint, params=None, headers=None, use_cache=True):
         """
         Get data from Microsoft Graph API.
         
+        Successful responses are cached for GRAPH_CACHE_TTL seconds; the cached
+        dictionary is shared between callers and must not be modified.
+        
         Args:
             endpoint: Graph API endpoint path
             params: Optional query parameters
+            headers: Optional extra request headers (e.g. Prefer)
+            use_cache: Serve and store the response through the response cache
             
         Returns:
             API response as dictionary
         """
-        if not self.token:
-            self.get_token()
-            
-        headers = {
-            'Authorization': f'Bearer {self.token}',
-            'Content-Type': 'application/json'
-        }
+        key = self._cache_key(endpoint, params, headers) if use_cache else None
+        if use_cache:
+            cached = self._cache_get(key)
+            if cached is not None:
+                return cached
+                
+        response = self._get(endpoint, params, headers, cache_key=key)
+        data = orjson.loads(response.content)
+        if use_cache and response.status_code == 200:
+            self._cache_put(key, data)
+        return data
         
-        url = f"https://graph.microsoft.com/v1.0/{endpoint}"
+    def _get(self, endpoint, params=None, headers=None, cache_key=None):
+        """Send a Graph GET request, refreshing the token and retrying once on 401"""
+        # Returns immediately while the token is fresh, and renews it ahead of expiry
+        self.get_token()
+            
+        # @odata.nextLink values are already absolute URLs
+        url = endpoint if endpoint.startswith("https://") else f"{GRAPH_BASE_URL}{endpoint}"
         
         try:
-            response = requests.get(url, headers=headers, params=params)
+            response = self._session.get(url, params=params, headers=headers)
             response.raise_for_status()  # Raise exception for HTTP errors
-            return response.json()
         except requests.exceptions.RequestException as e:
             logger.error(f"Graph API request failed: {str(e)}")
-            # If unauthorized, refresh token and retry once
-            if response.status_code == 401:
-                self.token = None
-                self.get_token()
-                headers['Authorization'] = f'Bearer {self.token}'
-                response = requests.get(url, headers=headers, params=params)
-                response.raise_for_status()
-                return response.json()
-            raise
+            # Only an actual 401 response warrants a token refresh and one retry
+            if not (isinstance(e, requests.exceptions.HTTPError) and e.response is not None
+                    and e.response.status_code == 401):
+                raise
+            self._expire_token()
+            if cache_key is not None:
+                with self._graph_cache_lock:
+                    self._graph_cache.pop(cache_key, None)
+            self.get_token()
+            response = self._session.get(url, params=params, headers=headers)
+            response.raise_for_status()
+        return response
+        
+    def get_graph_table(self, endpoint, fields, params=None, max_pages=GRAPH_MAX_PAGES):
+        """
+        Get the items of a Graph API listing as an Arrow table, parsed from the raw
+        response bytes without building Python objects.
+        
+        Args:
+            endpoint: Graph API endpoint path
+            fields: Dictionary of item field name to Arrow type; other fields are skipped
+            params: Optional query parameters
+            max_pages: Maximum number of pages to read
+            
+        Returns:
+            pyarrow.Table with one column per field
+        """
+        item_type = pa.struct([(name, field_type) for name, field_type in fields.items()])
+        schema = pa.schema([('value', pa.list_(item_type)), ('@odata.nextLink', pa.string())])
+        parse_options = pa_json.ParseOptions(explicit_schema=schema, unexpected_field_behavior='ignore')
+        
+        chunks = []
+        next_link = endpoint
+        pages = 0
+        while next_link and pages < max_pages:
+            content = self._get(next_link, params if pages == 0 else None).content
+            # Graph sends compact JSON, so each page is a single line-delimited record
+            page = pa_json.read_json(io.BytesIO(content), parse_options=parse_options,
+                                     read_options=pa_json.ReadOptions(block_size=len(content) + 1))
+            chunks.append(page.column('value').combine_chunks().flatten())
+            next_link = page.column('@odata.nextLink')[0].as_py()
+            pages += 1
+            
+        # StructArray.flatten() yields one child array per field, in schema order
+        columns = [chunk.flatten() for chunk in chunks]
+        return pa.table({name: pa.chunked_array([column[i] for column in columns], type=field_type)
+                         for i, (name, field_type) in enumerate(fields.items())})
+            
+            
+    def _collect_pages(self, first_page, limit=None, max_pages=GRAPH_MAX_PAGES, headers=None):
+        """
+        Gather the items of a Graph listing, following @odata.nextLink from its first page.
+        
+        Args:
+            first_page: First response page
+            limit: Maximum number of items to return (optional)
+            max_pages: Maximum number of pages to read, including the first
+            headers: Optional extra request headers for the follow-up pages
+            
+        Returns:
+            List of items
+        """
+        items = list(first_page.get("value", []))
+        next_link = first_page.get("@odata.nextLink")
+        pages = 1
+        while next_link and pages < max_pages and (limit is None or len(items) < limit):
+            page = self.get_graph_data(next_link, headers=headers)
+            items.extend(page.get("value", []))
+            next_link = page.get("@odata.nextLink")
+            pages += 1
+        return items[:limit] if limit is not None else items
+        
+    def get_graph_data_paged(self, endpoint, params=None, limit=None, max_pages=GRAPH_MAX_PAGES):
+        """
+        Get every item of a Graph API listing across result pages.
+        
+        Args:
+            endpoint: Graph API endpoint path
+            params: Optional query parameters
+            limit: Maximum number of items to return (optional)
+            max_pages: Maximum number of pages to read
+            
+        Returns:
+            List of items
+        """
+        return self._collect_pages(self.get_graph_data(endpoint, params), limit, max_pages)
     
-    def get_collaborative_patterns(self, days=7, limit=1000):
+    def _collect_delta(self, key, endpoint, params=None, headers=None, max_pages=GRAPH_MAX_PAGES):
+        """
+        Gather the items changed since the last delta sync of a Graph listing.
+        
+        The first sync for a key starts a delta round at endpoint/delta; later syncs
+        resume from the stored link, so only new changes are transferred.
+        
+        Args:
+            key: Name the delta link is stored under
+            endpoint: Graph API endpoint path of the listing
+            params: Optional query parameters for the first sync
+            headers: Optional extra request headers
+            max_pages: Maximum number of pages to read in this sync
+            
+        Returns:
+            List of added or updated items
+        """
+        link = self._delta_links.get(key)
+        page = None
+        # Delta links return new changes on every call, so they bypass the response cache
+        if link:
+            try:
+                page = self.get_graph_data(link, headers=headers, use_cache=False)
+            except requests.exceptions.HTTPError as e:
+                # Expired or invalidated links answer 410 Gone (resyncRequired); start a new round
+                logger.warning(f"Delta link for {key} rejected ({str(e)}); resynchronizing")
+                self._delta_links.pop(key, None)
+                link = None
+        if page is None:
+            page = self.get_graph_data(f"{endpoint}/delta", params, headers, use_cache=False)
+        items = list(page.get("value", []))
+        pages = 1
+        while "@odata.nextLink" in page and pages < max_pages:
+            page = self.get_graph_data(page["@odata.nextLink"], headers=headers, use_cache=False)
+            items.extend(page.get("value", []))
+            pages += 1
+            
+        # Resume from the delta link once the round completes, otherwise from the next unread page
+        self._delta_links[key] = page.get("@odata.deltaLink") or page.get("@odata.nextLink") or link
+        return [item for item in items if "@removed" not in item]
+        
+    def _post_graph_data(self, endpoint, body):
+        """POST a JSON body to a Graph API endpoint, refreshing the token once on 401"""
+        self.get_token()
+            
+        url = f"{GRAPH_BASE_URL}{endpoint}"
+        data = orjson.dumps(body)
+        
+        response = self._session.post(url, data=data)
+        if response.status_code == 401:
+            self._expire_token()
+            self.get_token()
+            response = self._session.post(url, data=data)
+        response.raise_for_status()
+        return orjson.loads(response.content)
+        
+    def batch_graph_data(self, requests_list, max_workers=8):
+        """
+        Get data from several Graph API endpoints through JSON batching.
+        
+        Requests are sent GRAPH_BATCH_LIMIT at a time to the $batch endpoint, with
+        the batches themselves posted concurrently. GET requests throttled or failed
+        transiently inside a batch are re-fetched individually after their Retry-After.
+        
+        Args:
+            requests_list: List of dicts with 'id', 'url' (endpoint path) and optional
+                'params', 'method' and 'headers' keys
+            max_workers: Maximum number of batches in flight
+            
+        Returns:
+            Dictionary of response bodies keyed by request id
+        """
+        # GET requests answered by the response cache never leave the process
+        results = {}
+        cache_keys = {}
+        pending = []
+        for request in requests_list:
+            if request.get('method', 'GET') == 'GET':
+                key = self._cache_key(request['url'], request.get('params'), request.get('headers'))
+                cached = self._cache_get(key)
+                if cached is not None:
+                    results[str(request['id'])] = cached
+                    continue
+                cache_keys[str(request['id'])] = key
+            pending.append(request)
+            
+        batches = []
+        for start in range(0, len(pending), GRAPH_BATCH_LIMIT):
+            batch = []
+            for request in pending[start:start + GRAPH_BATCH_LIMIT]:
+                url = f"/{request['url'].lstrip('/')}"
+                if request.get('params'):
+                    url = f"{url}?{urlencode(request['params'], safe='$,:', quote_via=quote)}"
+                entry = {'id': str(request['id']), 'method': request.get('method', 'GET'), 'url': url}
+                if request.get('headers'):
+                    entry['headers'] = request['headers']
+                batch.append(entry)
+            batches.append(('$batch', {'requests': batch}))
+            
+        if not batches:
+            return results
+            
+        self.get_token()
+            
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(batches))) as executor:
+            payloads = list(executor.map(lambda b: self._post_graph_data(*b), batches))
+            
+        # The session only retries the outer $batch call, which succeeds even when
+        # individual sub-requests are throttled
+        requests_by_id = {str(request['id']): request for request in pending}
+        retry_ids = []
+        retry_after = 0
+        for payload in payloads:
+            for response in payload.get('responses', []):
+                request_id = response.get('id')
+                status = response.get('status', 500)
+                if status in GRAPH_RETRY_STATUSES and request_id in cache_keys:
+                    retry_ids.append(request_id)
+                    delay = str((response.get('headers') or {}).get('Retry-After', ''))
+                    retry_after = max(retry_after, int(delay) if delay.isdigit() else 1)
+                    continue
+                if status >= 400:
+                    logger.error(f"Graph batch request {request_id} failed with status "
+                                 f"{status}: {response.get('body')}")
+                body = response.get('body') or {}
+                results[request_id] = body
+                if status == 200 and request_id in cache_keys:
+                    self._cache_put(cache_keys[request_id], body)
+                    
+        if retry_ids:
+            logger.warning(f"Graph batch requests {retry_ids} throttled; retrying in {retry_after}s")
+            time.sleep(retry_after)
+            for request_id in retry_ids:
+                request = requests_by_id[request_id]
+                results[request_id] = self.get_graph_data(request['url'], request.get('params'),
+                                                          request.get('headers'))
+        return results
+        
+    def get_collaborative_patterns(self, days=7, limit=1000, use_delta=False):
         """
         Extract collaboration patterns from Microsoft 365 for model improvement.
         
         Args:
             days: Number of days of historical data to retrieve
             limit: Maximum number of records to retrieve
+            use_delta: Fetch only the messages added since the previous delta sync
+                instead of scanning the last `days` days (days and limit are ignored)
             
         Returns:
             DataFrame of collaboration patterns
         """
         since_date = (datetime.now() - timedelta(days=days)).isoformat()
-        patterns = []
+        columns = {}
+        
+        # Select only the fields used below; plain-text Teams bodies are much smaller than HTML
+        teams_headers = {'Prefer': 'outlook.body-content-type="text"'}
+        teams_select = "body,reactions,replies,createdDateTime"
+        mail_select = "bodyPreview,importance,hasAttachments,createdDateTime"
         
         try:
-            # Get recent Teams messages
-            teams_data = self.get_graph_data(
-                "teams/getAllMessages", 
-                params={
-                    "$filter": f"createdDateTime ge {since_date}",
-                    "$top": limit
-                }
-            )
-            
-            # Process Teams messages
-            if "value" in teams_data:
-                for msg in teams_data["value"]:
-                    patterns.append({
-                        "source": "teams",
-                        "text": msg.get("body", {}).get("content", ""),
-                        "reactions": len(msg.get("reactions", [])),
-                        "replies": len(msg.get("replies", [])),
-                        "timestamp": msg.get("createdDateTime")
-                    })
-            
-            # Get recent Outlook emails
-            mail_data = self.get_graph_data(
-                "me/messages", 
-                params={
-                    "$filter": f"createdDateTime ge {since_date}",
-                    "$top": limit
-                }
-            )
+            if use_delta:
+                # Only changes since the last sync; mail delta queries are per folder
+                teams_messages = self._collect_delta('teams', "teams/getAllMessages",
+                                                     {"$select": teams_select}, teams_headers)
+                mail_messages = self._collect_delta('mail', "me/mailFolders/inbox/messages",
+                                                    {"$select": mail_select})
+            else:
+                # Get recent Teams messages and Outlook emails in one batch
+                batch = self.batch_graph_data([
+                    {'id': 'teams', 'url': "teams/getAllMessages", 'headers': teams_headers,
+                     'params': {"$filter": f"createdDateTime ge {since_date}", "$top": limit,
+                                "$select": teams_select}},
+                    {'id': 'mail', 'url': "me/messages",
+                     'params': {"$filter": f"createdDateTime ge {since_date}", "$top": limit,
+                                "$select": mail_select}}
+                ])
+                
+                # Follow nextLink pages so results are not capped at the first page
+                teams_messages = self._collect_pages(batch.get('teams', {}), limit, headers=teams_headers)
+                mail_messages = self._collect_pages(batch.get('mail', {}), limit)
             
-            # Process emails
-            if "value" in mail_data:
-                for mail in mail_data["value"]:
-                    patterns.append({
-                        "source": "outlook",
-                        "text": mail.get("bodyPreview", ""),
-                        "importance": mail.get("importance", "normal"),
-                        "has_attachments": mail.get("hasAttachments", False),
-                        "timestamp": mail.get("createdDateTime")
-                    })
+            # Build the frame column by column: Teams messages first, then emails,
+            # with fields a source does not have left missing
+            n_teams, n_mail = len(teams_messages), len(mail_messages)
+            columns = {
+                "source": ["teams"] * n_teams + ["outlook"] * n_mail,
+                "text": [msg.get("body", {}).get("content", "") for msg in teams_messages]
+                        + [mail.get("bodyPreview", "") for mail in mail_messages],
+                "reactions": [len(msg.get("reactions", [])) for msg in teams_messages] + [None] * n_mail,
+                "replies": [len(msg.get("replies", [])) for msg in teams_messages] + [None] * n_mail,
+                "importance": [None] * n_teams + [mail.get("importance", "normal") for mail in mail_messages],
+                "has_attachments": [None] * n_teams + [mail.get("hasAttachments", False) for mail in mail_messages],
+                "timestamp": [msg.get("createdDateTime") for msg in teams_messages]
+                             + [mail.get("createdDateTime") for mail in mail_messages]
+            }
             
-            return pd.DataFrame(patterns)
+            return _patterns_frame(columns)
             
         except Exception as e:
             logger.error(f"Error fetching collaboration patterns: {str(e)}")
-            return pd.DataFrame(patterns)
+            return _patterns_frame(columns)
     
     def extract_query_patterns(self, days=30):
         """
@@ -194,33 +623,50 @@ class MS365Connector:
             DataFrame of query patterns
         """
         since_date = (datetime.now() - timedelta(days=days)).isoformat()
-        patterns = []
+        columns = {}
         
         try:
+            # Parse the raw pages through Arrow when pyarrow is installed
+            if PYARROW_AVAILABLE:
+                try:
+                    return self._search_frame_arrow(since_date)
+                except pa.ArrowInvalid as e:
+                    logger.warning(f"Arrow parsing of search insights failed, using JSON: {str(e)}")
+                    
             # Get Microsoft Search insights
-            search_data = self.get_graph_data(
+            search_items = self.get_graph_data_paged(
                 "search/insights", 
                 params={
                     "$filter": f"createdDateTime ge {since_date}"
                 }
             )
             
-            # Process search data
-            if "value" in search_data:
-                for query in search_data["value"]:
-                    patterns.append({
-                        "query_text": query.get("queryText", ""),
-                        "result_count": query.get("resultCount", 0),
-                        "source": query.get("source", "unknown"),
-                        "timestamp": query.get("createdDateTime")
-                    })
+            # Process search data column by column; null fields take the default like missing ones
+            columns = {
+                name: [default if query.get(field) is None else query[field] for query in search_items]
+                for field, (_, name, default) in _SEARCH_FIELDS.items()
+            }
                     
-            return pd.DataFrame(patterns)
+            return pd.DataFrame(columns).astype(_SEARCH_DTYPES)
             
         except Exception as e:
             logger.error(f"Error fetching search patterns: {str(e)}")
-            return pd.DataFrame(patterns)
+            return pd.DataFrame(columns)
             
+    def _search_frame_arrow(self, since_date):
+        """Build the search patterns DataFrame from an Arrow table of the fields that are read"""
+        table = self.get_graph_table(
+            "search/insights",
+            {field: getattr(pa, type_name)() for field, (type_name, _, _) in _SEARCH_FIELDS.items()},
+            params={"$filter": f"createdDateTime ge {since_date}"}
+        )
+        columns = {}
+        for field, (_, name, default) in _SEARCH_FIELDS.items():
+            column = table.column(field)
+            columns[name] = column if default is None else column.fill_null(default)
+        frame = pa.table(columns).to_pandas(types_mapper={pa.string(): pd.StringDtype()}.get)
+        return frame.astype(_SEARCH_DTYPES)
+        
     def improve_model_with_insights(self, model, days=30):
         """
         Use MS365 data to improve anomaly detection model.
@@ -245,12 +691,13 @@ class MS365Connector:
                 
             # Extract useful features from patterns
             if not patterns_df.empty:
-                # Text length distribution
-                patterns_df['text_length'] = patterns_df['text'].apply(lambda x: len(x) if isinstance(x, str) else 0)
-                
-                # Word count distribution
-                patterns_df['word_count'] = patterns_df['text'].apply(
-                    lambda x: len(x.split()) if isinstance(x, str) else 0
+                # Text length and word count distributions
+                text = patterns_df['text']
+                patterns_df = patterns_df.assign(
+                    text_length=text.str.len().astype('int32'),
+                    # split() rather than a \S+ regex: Arrow strings run regexes on RE2, whose \s
+                    # misses Unicode whitespace such as NBSP
+                    word_count=text.str.split().str.len().astype('int32')
                 )
                 
                 # Feature vector for model enhancement
@@ -258,6 +705,9 @@ class MS365Connector:
                 word_count_dist = patterns_df['word_count'].describe().to_dict()
                 
                 logger.info(f"Enhanced model with {len(patterns_df)} collaboration patterns")
+                if logger.isEnabledFor(logging.DEBUG):
+                    logger.debug(f"Collaboration patterns use "
+                                 f"{patterns_df.memory_usage(deep=True).sum() / 1024:.1f} KiB")
                 
                 # Here you would typically use these insights to adjust model parameters
                 # For demonstration purposes, we're just logging the insights
@@ -282,46 +732,62 @@ class MS365InsightExtractor:
         """
         self.connector = connector
         
-    def extract_common_topics(self, days=30, min_frequency=2):
+        # Collaboration patterns per lookback window: days -> (expires_at, DataFrame)
+        self._patterns_cache = {}
+        
+    def _cached_patterns(self, days):
+        """Return collaboration patterns for a window, fetching them at most once per PATTERNS_CACHE_TTL"""
+        entry = self._patterns_cache.get(days)
+        if entry is not None and entry[0] > time.monotonic():
+            return entry[1]
+            
+        patterns_df = self.connector.get_collaborative_patterns(days=days)
+        # An empty frame may stand for a swallowed Graph error, so it is fetched again next time
+        if not patterns_df.empty:
+            self._patterns_cache[days] = (time.monotonic() + PATTERNS_CACHE_TTL, patterns_df)
+        return patterns_df
+        
+    def extract_common_topics(self, days=30, min_frequency=2, use_parallel=True, top_k=None):
         """
         Extract common topics from Microsoft 365 communications.
         
         Args:
             days: Number of days of historical data
             min_frequency: Minimum frequency to consider a topic common
+            use_parallel: Count large corpora (PARALLEL_TOPIC_MIN_ROWS texts or more)
+                in chunks across all cores
+            top_k: Return only the top_k most frequent topics (optional)
             
         Returns:
             Dictionary of common topics with their frequencies
         """
-        patterns_df = self.connector.get_collaborative_patterns(days=days)
+        patterns_df = self._cached_patterns(days)
         
         if patterns_df.empty:
             return {}
             
-        # Simple topic extraction based on word frequency
-        all_words = []
-        for text in patterns_df['text']:
-            if isinstance(text, str):
-                words = [word.lower() for word in text.split() 
-                         if len(word) > 3 and word.isalnum()]
-                all_words.extend(words)
-        
-        # Count word frequencies
-        word_counts = {}
-        for word in all_words:
-            if word not in word_counts:
-                word_counts[word] = 0
-            word_counts[word] += 1
-        
-        # Filter by minimum frequency
-        common_topics = {word: count for word, count in word_counts.items() 
-                        if count >= min_frequency}
-        
-        # Sort by frequency (descending)
-        common_topics = dict(sorted(common_topics.items(), 
-                                    key=lambda x: x[1], reverse=True))
+        # Tokenizing is CPU-bound Python work, so large corpora are split into one
+        # chunk per core and the per-chunk counts merged
+        if use_parallel and JOBLIB_AVAILABLE and len(patterns_df) >= PARALLEL_TOPIC_MIN_ROWS:
+            texts = patterns_df['text'].to_numpy(dtype=object)
+            counters = Parallel(n_jobs=-1)(
+                delayed(_count_topics)(chunk) for chunk in np.array_split(texts, cpu_count()))
+            word_counts = Counter()
+            for counts in counters:
+                word_counts.update(counts)
+            # most_common(top_k) selects with a heap instead of sorting the whole vocabulary
+            return {word: count for word, count in word_counts.most_common(top_k) if count >= min_frequency}
+            
+        # Simple topic extraction based on word frequency, tokenized and counted by pandas
+        words = patterns_df['text'].str.lower().str.findall(_TOKEN_RE)
+        word_counts = words.explode().value_counts(sort=top_k is None)
         
-        return common_topics
+        # Most frequent first, filtered by minimum frequency; top_k is selected
+        # with nlargest rather than a full sort
+        common_topics = word_counts[word_counts >= min_frequency]
+        if top_k is not None:
+            common_topics = common_topics.nlargest(top_k)
+        return {word: int(count) for word, count in common_topics.items()}
         
     def extract_organization_entities(self, days=30):
         """
@@ -333,7 +799,6 @@ class MS365InsightExtractor:
         Returns:
             Dictionary of entity types with lists of entities
         """
-        patterns_df = self.connector.get_collaborative_patterns(days=days)
         entities = {
             'people': set(),
             'teams': set(),
@@ -345,21 +810,18 @@ class MS365InsightExtractor:
         
         # Get organization data from MS Graph
         try:
-            # Get users
-            users_data = self.connector.get_graph_data("users", params={"$top": 100})
-            if "value" in users_data:
-                for user in users_data["value"]:
-                    display_name = user.get("displayName")
-                    if display_name:
-                        entities['people'].add(display_name)
-            
-            # Get teams
-            teams_data = self.connector.get_graph_data("teams", params={"$top": 100})
-            if "value" in teams_data:
-                for team in teams_data["value"]:
-                    display_name = team.get("displayName")
-                    if display_name:
-                        entities['teams'].add(display_name)
+            # Get users and teams in one batch
+            batch = self.connector.batch_graph_data([
+                {'id': 'users', 'url': "users", 'params': {"$top": 100, "$select": "displayName,id"}},
+                {'id': 'teams', 'url': "teams", 'params': {"$top": 100, "$select": "displayName,id"}}
+            ])
+            users_data = batch.get('users', {})
+            teams_data = batch.get('teams', {})
+            
+            entities['people'] = {user["displayName"] for user in users_data.get("value", ())
+                                  if user.get("displayName")}
+            entities['teams'] = {team["displayName"] for team in teams_data.get("value", ())
+                                 if team.get("displayName")}
                         
             # Projects would typically come from Project or Planner
             # This is a simplified example